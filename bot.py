@@ -1,9 +1,10 @@
 import os
 import csv
 import random
-from typing import Dict, List
+import time
+from typing import Dict, List, Optional, Tuple
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, ApplicationHandlerStop, CommandHandler, CallbackQueryHandler, MessageHandler, TypeHandler, filters, ContextTypes
 from dotenv import load_dotenv
 
 # Завантажити змінні середовища
@@ -44,6 +45,50 @@ class GameStates:
     VOTING = "voting"
     FINISHED = "finished"
 
+# Обмеження частоти запитів: (місткість відра, поповнення токенів за секунду)
+USER_RATE_LIMIT = (8, 1.0)
+ROOM_RATE_LIMIT = (20, 4.0)
+# Невдалі спроби вгадати код: скільки дозволено без паузи, максимальна пауза (сек)
+# та через скільки секунд без помилок лічильник обнуляється
+JOIN_FREE_ATTEMPTS = 3
+JOIN_MAX_BACKOFF = 300
+JOIN_FAILURE_RESET = 900
+# Як часто прибирати застарілі записи (сек)
+THROTTLE_PRUNE_INTERVAL = 60
+
+# --- ОБМЕЖЕННЯ ЧАСТОТИ ЗАПИТІВ ---
+
+class TokenBucketLimiter:
+    """Набір відер токенів з ключем (користувач або кімната)"""
+
+    def __init__(self, capacity: int, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.idle_expiry = capacity / refill_rate
+        self.buckets: Dict[object, Tuple[float, float]] = {}
+
+    def allow(self, key, now: float) -> bool:
+        """Списати один токен; False, якщо відро порожнє"""
+        tokens, updated = self.buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated) * self.refill_rate)
+        if tokens < 1:
+            self.buckets[key] = (tokens, now)
+            return False
+        self.buckets[key] = (tokens - 1, now)
+        return True
+
+    def prune(self, now: float):
+        """Видалити відра, які вже повністю поповнилися"""
+        expired = [key for key, (_, updated) in self.buckets.items() if now - updated >= self.idle_expiry]
+        for key in expired:
+            del self.buckets[key]
+
+user_limiter = TokenBucketLimiter(*USER_RATE_LIMIT)
+room_limiter = TokenBucketLimiter(*ROOM_RATE_LIMIT)
+# user_id -> [кількість невдалих спроб, заблоковано до, час останньої помилки]
+join_failures: Dict[int, List[float]] = {}
+last_prune = 0.0
+
 # --- ФУНКЦІЇ ЗАВАНТАЖЕННЯ ДАНИХ ---
 
 def load_questions():
@@ -91,6 +136,67 @@ def generate_game_code() -> str:
     """Генерувати унікальний код гри"""
     return ''.join(random.choices('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789', k=6))
 
+def prune_throttle_state(now: float):
+    """Періодично прибирати застарілі записи обмежувачів"""
+    global last_prune
+    if now - last_prune < THROTTLE_PRUNE_INTERVAL:
+        return
+    last_prune = now
+    user_limiter.prune(now)
+    room_limiter.prune(now)
+    expired = [user_id for user_id, (_, blocked_until, last_fail) in join_failures.items()
+               if now >= blocked_until and now - last_fail >= JOIN_FAILURE_RESET]
+    for user_id in expired:
+        del join_failures[user_id]
+
+def find_game_code(callback_data: str) -> Optional[str]:
+    """Знайти код існуючої гри в callback_data"""
+    return next((part for part in callback_data.split('_') if part in games), None)
+
+def join_backoff_remaining(user_id: int, now: float) -> int:
+    """Скільки секунд користувач ще має чекати перед новою спробою коду"""
+    record = join_failures.get(user_id)
+    if not record or now >= record[1]:
+        return 0
+    return int(record[1] - now) + 1
+
+def register_join_failure(user_id: int, now: float):
+    """Зарахувати невдалу спробу коду та подовжити паузу"""
+    fails, _, last_fail = join_failures.get(user_id, [0, 0.0, now])
+    if now - last_fail >= JOIN_FAILURE_RESET:
+        fails = 0
+    fails += 1
+    backoff = 0
+    if fails > JOIN_FREE_ATTEMPTS:
+        backoff = min(JOIN_MAX_BACKOFF, 2 ** (fails - JOIN_FREE_ATTEMPTS))
+    join_failures[user_id] = [fails, now + backoff, now]
+
+async def throttle_updates(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Відкинути оновлення від користувачів чи кімнат, що перевищили ліміт"""
+    user = update.effective_user
+    if not user:
+        return
+
+    now = time.monotonic()
+    prune_throttle_state(now)
+
+    query = update.callback_query
+    allowed = user_limiter.allow(user.id, now)
+    if allowed and query and query.data:
+        game_code = find_game_code(query.data)
+        if game_code:
+            allowed = room_limiter.allow(game_code, now)
+
+    if allowed:
+        return
+
+    if query:
+        try:
+            await query.answer("⏳ Занадто часто! Зачекайте трохи.")
+        except Exception as e:
+            print(f"Не вдалося відповісти на запит користувача {user.id}: {e}")
+    raise ApplicationHandlerStop
+
 # --- ОСНОВНІ ОБРОБНИКИ КОМАНД ---
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -220,8 +326,15 @@ async def handle_join_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     code = update.message.text.strip().upper()
     user_id = update.message.from_user.id
     user_name = update.message.from_user.first_name or "Гравець"
+    now = time.monotonic()
+    
+    wait_seconds = join_backoff_remaining(user_id, now)
+    if wait_seconds:
+        await update.message.reply_text(f"⏳ Забагато невдалих спроб! Спробуйте через {wait_seconds} с.")
+        return
     
     if code not in games:
+        register_join_failure(user_id, now)
         keyboard = [[InlineKeyboardButton("🏠 Головне меню", callback_data='back_to_menu')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text("❌ Гра з таким кодом не знайдена!\nПеревірте код і спробуйте ще раз.", reply_markup=reply_markup)
@@ -246,6 +359,7 @@ async def handle_join_code(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     game['players'].append({'id': user_id, 'name': user_name})
     game['scores'][user_id] = 0
+    join_failures.pop(user_id, None)
     
     context.user_data['waiting_for_code'] = False
     
@@ -634,6 +748,9 @@ def main():
     
     application = Application.builder().token(token).build()
     
+    # Обмеження частоти запитів перед усіма іншими обробниками
+    application.add_handler(TypeHandler(Update, throttle_updates), group=-1)
+    
     # Реєстрація обробників
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CallbackQueryHandler(create_game, pattern='create_game'))